@@ -9,7 +9,7 @@ If you are a beginner, follow README.md steps — easiest approach is to set BOT
 Features:
 - Multi-user isolated folders per user
 - Upload .py or .zip; extracts first .py
-- Background running with subprocess.Popen (unbuffered)
+- Background running with subprocess.Popen (block-buffered output; APP_UNBUFFERED=1 for live logs)
 - Per-app logs in /tmp/hostbot/logs (Render-friendly)
 - Auto-detect ModuleNotFoundError in logs and attempt pip install (with safe retry)
 - Commands: /start, /help, /upload (send file), /myapps, /panel, /logs <id>, /stop <id>, /stats, /admin (owner only)
@@ -18,13 +18,19 @@ Features:
 import os
 import sys
 import json
+import logging
+import re
 import sqlite3
 import asyncio
+import queue
+import threading
 import zipfile
 import subprocess
+import shutil
 import signal
 import time
-from pathlib import Path
+from contextlib import contextmanager
+from pathlib import Path, PurePosixPath
 from datetime import datetime
 from typing import Optional, Tuple
 
@@ -34,10 +40,20 @@ try:
     from aiogram import Bot, Dispatcher, types
     from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
     from aiogram.filters import Command
+    from aiogram.methods import SendMessage, EditMessageText
+    from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+    from aiolimiter import AsyncLimiter
 except Exception as e:
     print("Missing packages. Install requirements.txt then rerun.")
     raise
 
+try:
+    from watchfiles import awatch, Change
+except ImportError:
+    awatch = None  # fall back to polling the logs
+
+log = logging.getLogger(__name__)
+
 # ---------------- Configuration ----------------
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 CONFIG_PATH = Path("config.json")
@@ -60,7 +76,7 @@ if not ADMIN_IDS and CONFIG_PATH.exists():
         ADMIN_IDS = cfg.get("ADMIN_IDS", "")
     except Exception:
         ADMIN_IDS = ""
-ADMIN_IDS = [int(x.strip()) for x in str(ADMIN_IDS).split(",") if str(x).strip().isdigit()]
+ADMIN_IDS = frozenset(int(x.strip()) for x in str(ADMIN_IDS).split(",") if x.strip().isdigit())
 
 # Host paths (use /tmp for Render/Heroku safety)
 BASE_DIR = Path(os.getenv("HOSTBOT_BASE", "/tmp/hostbot"))
@@ -70,146 +86,325 @@ DB_PATH = BASE_DIR / "hostbot.db"
 
 # Configurable limits
 MAX_APPS_PER_USER = int(os.getenv("MAX_APPS_PER_USER", "6"))
+MAX_ZIP_MEMBER_BYTES = int(os.getenv("MAX_ZIP_MEMBER_BYTES", str(50 * 1024 * 1024)))
+MAX_ZIP_TOTAL_BYTES = int(os.getenv("MAX_ZIP_TOTAL_BYTES", str(200 * 1024 * 1024)))
+ZIP_SKIP_DIRS = {"__MACOSX", "__pycache__", ".git", "node_modules", ".venv", "venv"}
 MODULE_INSTALL_RETRIES = int(os.getenv("MODULE_INSTALL_RETRIES", "1"))
 PIP_INSTALL_TIMEOUT = int(os.getenv("PIP_INSTALL_TIMEOUT", "120"))  # seconds
+DOWNLOAD_TIMEOUT = int(os.getenv("DOWNLOAD_TIMEOUT", "120"))  # seconds
+DOWNLOAD_CHUNK_SIZE = 65536
 LOG_SCAN_INTERVAL = int(os.getenv("LOG_SCAN_INTERVAL", "6"))  # seconds
+# Apps run block-buffered by default (fewer write syscalls). Output then shows up in /logs in
+# ~8 KiB batches and whatever is still buffered is lost on /stop (SIGTERM doesn't flush).
+# Set APP_UNBUFFERED=1 to run apps with PYTHONUNBUFFERED=1 instead.
+APP_UNBUFFERED = os.getenv("APP_UNBUFFERED", "0").lower() in ("1", "true", "yes")
+APP_DEPS_DIRNAME = ".deps"  # per-app pip --target dir, prepended to the app's PYTHONPATH
 APP_LOG_TAIL_CHARS = int(os.getenv("APP_LOG_TAIL_CHARS", "3500"))
+SEND_RATE_PER_SEC = int(os.getenv("SEND_RATE_PER_SEC", "30"))  # Telegram global message limit
 
 # Ensure directories exist
 for p in (BASE_DIR, USERS_DIR, LOGS_DIR):
     p.mkdir(parents=True, exist_ok=True)
 
 # ---------------- Database helpers ----------------
+DB_READERS = int(os.getenv("DB_READERS", "4"))
+DB_CACHED_STATEMENTS = 256
+DB_PRAGMAS = (
+    "journal_mode=WAL",
+    "synchronous=NORMAL",
+    "cache_size=-65536",
+    "foreign_keys=ON",
+    "busy_timeout=5000",
+)
+
+# Statement texts live here so every call reuses the same SQL and hits the per-connection statement cache.
+SQL_INSERT_USER = "INSERT OR IGNORE INTO users (user_id) VALUES (?)"
+SQL_INSERT_APP = "INSERT INTO apps (user_id, chat_id, name, folder, entrypoint) VALUES (?, ?, ?, ?, ?)"
+SQL_UPDATE_APP_PID = "UPDATE apps SET pid=?, status=?, last_start=CURRENT_TIMESTAMP WHERE id=?"
+SQL_SET_APP_STATUS = "UPDATE apps SET status=? WHERE id=?"
+SQL_SET_APP_STOPPED = "UPDATE apps SET pid=0, status='stopped' WHERE id=?"
+SQL_MARK_APP_INSTALLING = "UPDATE apps SET pid=0, status='installing', install_attempts = install_attempts + 1 WHERE id=?"
+SQL_GET_APP = "SELECT id, user_id, chat_id, name, folder, entrypoint, pid, status, created_at, last_start, install_attempts FROM apps WHERE id=?"
+SQL_LIST_USER_APPS = "SELECT id, name, entrypoint, pid, status, created_at FROM apps WHERE user_id=? ORDER BY id DESC"
+SQL_LIST_RUNNING_APPS = "SELECT id, user_id, name, pid FROM apps WHERE status='running'"
+SQL_DELETE_APP = "DELETE FROM apps WHERE id=?"
+SQL_COUNT_USERS_AND_APPS = "SELECT (SELECT COUNT(*) FROM users), (SELECT COUNT(*) FROM apps)"
+
+class DBPool:
+    """One writer connection plus a queue of reader connections, all in WAL mode.
+
+    Connections stay open for the life of the process, so helpers no longer pay
+    connect/schema-parse/journal-init on every call. Writes are serialized by a
+    lock and run inside BEGIN IMMEDIATE to avoid SQLITE_BUSY upgrades.
+    """
+
+    def __init__(self, path: Path, readers: int = DB_READERS):
+        self.path = path
+        self._write_lock = threading.Lock()
+        self._writer = self._connect()
+        self._readers = queue.Queue()
+        for _ in range(max(1, readers)):
+            self._readers.put(self._connect())
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, isolation_level=None, cached_statements=DB_CACHED_STATEMENTS, check_same_thread=False)
+        for pragma in DB_PRAGMAS:
+            conn.execute(f"PRAGMA {pragma}")
+        return conn
+
+    @contextmanager
+    def read(self):
+        conn = self._readers.get()
+        cur = conn.cursor()
+        try:
+            yield cur
+        finally:
+            cur.close()
+            self._readers.put(conn)
+
+    @contextmanager
+    def write(self):
+        with self._write_lock:
+            cur = self._writer.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                yield cur
+            except BaseException:
+                cur.execute("ROLLBACK")
+                raise
+            else:
+                cur.execute("COMMIT")
+            finally:
+                cur.close()
+
+pool: Optional[DBPool] = None
+
+# Short-lived per-user cache of list_user_apps() for the panel; stale reads for a couple of seconds are fine there.
+APPS_CACHE_TTL = 2.0  # seconds
+APPS_CACHE_MAXSIZE = 1024
+_apps_cache: dict = {}  # user_id -> (expires_at, rows)
+_apps_cache_gen: dict = {}  # user_id -> invalidation counter, so in-flight reads don't store stale rows
+
+def invalidate_apps_cache(user_id:int):
+    _apps_cache_gen[user_id] = _apps_cache_gen.get(user_id, 0) + 1
+    _apps_cache.pop(user_id, None)
+
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS apps (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        chat_id INTEGER,
-        name TEXT,
-        folder TEXT,
-        entrypoint TEXT,
-        pid INTEGER DEFAULT 0,
-        status TEXT DEFAULT 'stopped',
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        last_start TIMESTAMP,
-        install_attempts INTEGER DEFAULT 0
-    );
-    """)
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS users (
-        user_id INTEGER PRIMARY KEY,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    );
-    """)
-    conn.commit()
-    conn.close()
+    global pool
+    if pool is None:
+        pool = DBPool(DB_PATH)
+    with pool.write() as cur:
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS apps (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            chat_id INTEGER,
+            name TEXT,
+            folder TEXT,
+            entrypoint TEXT,
+            pid INTEGER DEFAULT 0,
+            status TEXT DEFAULT 'stopped',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_start TIMESTAMP,
+            install_attempts INTEGER DEFAULT 0
+        );
+        """)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """)
 
 def register_user(user_id:int):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("INSERT OR IGNORE INTO users (user_id) VALUES (?)", (user_id,))
-    conn.commit()
-    conn.close()
+    with pool.write() as cur:
+        cur.execute(SQL_INSERT_USER, (user_id,))
 
 def add_app(user_id:int, chat_id:int, name:str, folder:str, entrypoint:str) -> int:
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("INSERT INTO apps (user_id, chat_id, name, folder, entrypoint) VALUES (?, ?, ?, ?, ?)",
-                (user_id, chat_id, name, folder, entrypoint))
-    conn.commit()
-    app_id = cur.lastrowid
-    conn.close()
+    with pool.write() as cur:
+        cur.execute(SQL_INSERT_APP, (user_id, chat_id, name, folder, entrypoint))
+        app_id = cur.lastrowid
+    invalidate_apps_cache(user_id)
     return app_id
 
-def update_app_pid(app_id:int, pid:int, status:str):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("UPDATE apps SET pid=?, status=?, last_start=CURRENT_TIMESTAMP WHERE id=?", (pid, status, app_id))
-    conn.commit()
-    conn.close()
-
-def set_app_status(app_id:int, status:str):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("UPDATE apps SET status=? WHERE id=?", (status, app_id))
-    conn.commit()
-    conn.close()
-
-def increment_install_attempts(app_id:int):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("UPDATE apps SET install_attempts = install_attempts + 1 WHERE id=?", (app_id,))
-    conn.commit()
-    conn.close()
+def update_app_pid(app_id:int, pid:int, status:str, user_id:int):
+    with pool.write() as cur:
+        cur.execute(SQL_UPDATE_APP_PID, (pid, status, app_id))
+    invalidate_apps_cache(user_id)
+
+def set_app_status(app_id:int, status:str, user_id:int):
+    with pool.write() as cur:
+        cur.execute(SQL_SET_APP_STATUS, (status, app_id))
+    invalidate_apps_cache(user_id)
+    if status == "error":
+        close_log_file(app_id)
+
+def set_app_stopped(app_id:int, user_id:int):
+    with pool.write() as cur:
+        cur.execute(SQL_SET_APP_STOPPED, (app_id,))
+    invalidate_apps_cache(user_id)
+    close_log_file(app_id)
+
+def set_apps_stopped(apps):
+    """Mark several apps stopped in a single write transaction; apps is a list of (app_id, user_id)."""
+    with pool.write() as cur:
+        cur.executemany(SQL_SET_APP_STOPPED, [(aid,) for aid, user_id in apps])
+    for user_id in {user_id for aid, user_id in apps}:
+        invalidate_apps_cache(user_id)
+    for aid, user_id in apps:
+        close_log_file(aid)
+
+def mark_app_installing(app_id:int, user_id:int):
+    with pool.write() as cur:
+        cur.execute(SQL_MARK_APP_INSTALLING, (app_id,))
+    invalidate_apps_cache(user_id)
 
 def get_app(app_id:int):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("SELECT id, user_id, chat_id, name, folder, entrypoint, pid, status, created_at, last_start, install_attempts FROM apps WHERE id=?", (app_id,))
-    row = cur.fetchone()
-    conn.close()
-    return row
+    with pool.read() as cur:
+        cur.execute(SQL_GET_APP, (app_id,))
+        return cur.fetchone()
 
 def list_user_apps(user_id:int):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("SELECT id, name, entrypoint, pid, status, created_at FROM apps WHERE user_id=? ORDER BY id DESC", (user_id,))
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    with pool.read() as cur:
+        cur.execute(SQL_LIST_USER_APPS, (user_id,))
+        return cur.fetchall()
 
 def list_running_apps():
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("SELECT id, user_id, name, pid FROM apps WHERE status='running'")
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    with pool.read() as cur:
+        cur.execute(SQL_LIST_RUNNING_APPS)
+        return cur.fetchall()
 
 def delete_app(app_id:int):
     row = get_app(app_id)
     if not row:
         return False
     folder = Path(row[4])
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("DELETE FROM apps WHERE id=?", (app_id,))
-    conn.commit()
-    conn.close()
+    with pool.write() as cur:
+        cur.execute(SQL_DELETE_APP, (app_id,))
+    invalidate_apps_cache(row[1])
     # remove folder and log file (best-effort)
     try:
-        log_file = LOGS_DIR / f"{row[1]}_app_{app_id}.log"
-        if log_file.exists():
-            log_file.unlink()
-    except Exception:
-        pass
-    try:
-        if folder.exists() and folder.is_dir():
-            for child in folder.rglob("*"):
-                try:
-                    if child.is_file():
-                        child.unlink()
-                except Exception:
-                    pass
-            try:
-                folder.rmdir()
-            except Exception:
-                pass
+        close_log_file(app_id)
+        _log_offsets.pop(app_id, None)
+        (LOGS_DIR / f"{row[1]}_app_{app_id}.log").unlink(missing_ok=True)
     except Exception:
         pass
+    shutil.rmtree(folder, ignore_errors=True)
     return True
 
+def count_users_and_apps() -> Tuple[int, int]:
+    with pool.read() as cur:
+        cur.execute(SQL_COUNT_USERS_AND_APPS)
+        users, apps = cur.fetchone()
+        return users or 0, apps or 0
+
+# Async wrappers: run the blocking helpers in a worker thread so the event loop keeps serving other users.
+async def aregister_user(user_id:int):
+    return await asyncio.to_thread(register_user, user_id)
+
+async def aadd_app(user_id:int, chat_id:int, name:str, folder:str, entrypoint:str) -> int:
+    return await asyncio.to_thread(add_app, user_id, chat_id, name, folder, entrypoint)
+
+async def aupdate_app_pid(app_id:int, pid:int, status:str, user_id:int):
+    return await asyncio.to_thread(update_app_pid, app_id, pid, status, user_id)
+
+async def aset_app_status(app_id:int, status:str, user_id:int):
+    return await asyncio.to_thread(set_app_status, app_id, status, user_id)
+
+async def aset_app_stopped(app_id:int, user_id:int):
+    return await asyncio.to_thread(set_app_stopped, app_id, user_id)
+
+async def aset_apps_stopped(apps):
+    return await asyncio.to_thread(set_apps_stopped, apps)
+
+async def amark_app_installing(app_id:int, user_id:int):
+    return await asyncio.to_thread(mark_app_installing, app_id, user_id)
+
+async def aget_app(app_id:int):
+    return await asyncio.to_thread(get_app, app_id)
+
+async def alist_user_apps(user_id:int):
+    return await asyncio.to_thread(list_user_apps, user_id)
+
+async def alist_user_apps_cached(user_id:int):
+    hit = _apps_cache.get(user_id)
+    now = time.monotonic()
+    if hit and hit[0] > now:
+        return hit[1]
+    gen = _apps_cache_gen.get(user_id, 0)
+    rows = await alist_user_apps(user_id)
+    if _apps_cache_gen.get(user_id, 0) != gen:
+        return rows  # invalidated while reading; don't cache possibly stale rows
+    if len(_apps_cache) >= APPS_CACHE_MAXSIZE:
+        _apps_cache.clear()
+    _apps_cache[user_id] = (now + APPS_CACHE_TTL, rows)
+    return rows
+
+async def alist_running_apps():
+    return await asyncio.to_thread(list_running_apps)
+
+async def adelete_app(app_id:int):
+    return await asyncio.to_thread(delete_app, app_id)
+
+async def acount_users_and_apps() -> Tuple[int, int]:
+    return await asyncio.to_thread(count_users_and_apps)
+
 # ---------------- Utilities ----------------
+class _SafeNameTable(dict):
+    """str.translate table: keeps alphanumerics and -_. and maps everything else to _.
+
+    ASCII is precomputed; other code points are decided on lookup (isalnum()) and not stored.
+    """
+
+    def __missing__(self, code:int) -> str:
+        c = chr(code)
+        return c if c.isalnum() else "_"
+
+_SAFE_NAME_TABLE = _SafeNameTable({i: (chr(i) if chr(i).isalnum() or chr(i) in "-_." else "_") for i in range(128)})
+
 def safe_name(s: str) -> str:
-    return "".join(c if c.isalnum() or c in "-_." else "_" for c in s)[:120]
+    return s[:120].translate(_SAFE_NAME_TABLE)
 
-def find_first_py(dirpath: Path) -> Optional[Path]:
-    for p in dirpath.rglob("*.py"):
-        return p
-    return None
+def tail_bytes(path: Path, n: int) -> Tuple[str, bool]:
+    """Return (last n bytes of path decoded as text, whether earlier bytes were skipped).
+
+    Only the tail is read; truncation is decided from the same fstat as the seek.
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        size = os.fstat(fd).st_size
+        truncated = size > n
+        if truncated:
+            os.lseek(fd, size - n, os.SEEK_SET)
+        data = os.read(fd, n)
+    finally:
+        os.close(fd)
+    return data.decode(errors="ignore"), truncated
+
+class ZipTooLarge(ValueError):
+    """Raised by extract_zip when the archive exceeds MAX_ZIP_MEMBER_BYTES / MAX_ZIP_TOTAL_BYTES."""
+
+def extract_zip(zip_path: Path, dest: Path) -> Optional[str]:
+    """Extract zip_path into dest and return the first .py (relative posix path).
+
+    Entries under ZIP_SKIP_DIRS are skipped. Sizes are checked before anything is written,
+    so an oversized archive raises ZipTooLarge without extracting a single member (zip-bomb guard).
+    """
+    entrypoint = None
+    with zipfile.ZipFile(zip_path, "r") as z:
+        members = [
+            info for info in z.infolist()
+            if not info.is_dir()
+            and not any(part in ZIP_SKIP_DIRS for part in PurePosixPath(info.filename).parts[:-1])
+        ]
+        if (any(info.file_size > MAX_ZIP_MEMBER_BYTES for info in members)
+                or sum(info.file_size for info in members) > MAX_ZIP_TOTAL_BYTES):
+            raise ZipTooLarge("zip contents too large")
+        for info in members:
+            out = Path(z.extract(info, dest))
+            if entrypoint is None and info.filename.endswith(".py"):
+                entrypoint = out.relative_to(dest).as_posix()
+    return entrypoint
 
 def human_seconds(text_seconds: float) -> str:
     sec = int(text_seconds)
@@ -221,20 +416,51 @@ def human_seconds(text_seconds: float) -> str:
     return " ".join(parts) if parts else "0s"
 
 # ---------------- Process management ----------------
-def start_process(entry:Path, cwd:Path, log_path:Path) -> Tuple[bool, str]:
+# app_id -> log file object, shared by an app's restarts (e.g. after auto-install).
+# Closed again once the app is stopped, errors out or is deleted, so idle apps hold no fd.
+_log_files: dict = {}
+
+def close_log_file(app_id:int):
+    f = _log_files.pop(app_id, None)
+    if f:
+        f.close()
+
+def start_process(app_id:int, entry:Path, cwd:Path, log_path:Path) -> Tuple[bool, str]:
     try:
-        f = open(log_path, "a+", buffering=1)
+        f = _log_files.get(app_id)
+        if f is None:
+            f = _log_files[app_id] = open(log_path, "ab")
+        env = os.environ.copy()
+        deps = str(cwd / APP_DEPS_DIRNAME)
+        env["PYTHONPATH"] = deps + os.pathsep + env["PYTHONPATH"] if env.get("PYTHONPATH") else deps
+        if APP_UNBUFFERED:
+            env["PYTHONUNBUFFERED"] = "1"
         popen = subprocess.Popen(
-            ["python3", "-u", str(entry)],
+            ["python3", str(entry)],
             cwd=str(cwd),
+            env=env,
             stdout=f,
             stderr=subprocess.STDOUT,
-            preexec_fn=os.setsid
+            start_new_session=True,
+            close_fds=True
         )
         return True, str(popen.pid)
     except Exception as e:
         return False, f"start error: {e}"
 
+_cpu_samplers: dict = {}  # pid -> psutil.Process holding the previous cpu_percent() sample
+
+def process_cpu_percent(p) -> Optional[float]:
+    """Non-blocking CPU% since the previous call for this process; None on the first sample."""
+    sampler = _cpu_samplers.get(p.pid)
+    if sampler is not None and sampler.create_time() == p.create_time():
+        return sampler.cpu_percent(None)
+    for pid in [pid for pid, s in _cpu_samplers.items() if not s.is_running()]:
+        del _cpu_samplers[pid]
+    p.cpu_percent(None)
+    _cpu_samplers[p.pid] = p
+    return None
+
 def stop_process(pid:int):
     try:
         os.killpg(os.getpgid(pid), signal.SIGTERM)
@@ -247,10 +473,17 @@ def stop_process(pid:int):
         pass
 
 # ---------------- Auto-install watcher ----------------
-async def pip_install_package(package:str) -> Tuple[bool, str]:
+LOG_SCAN_FIRST_BYTES = 4000
+_MISSING_MODULE_RE = re.compile(rb"ModuleNotFoundError: No module named ['\"]([\w.]+)['\"]")
+_LOG_NAME_RE = re.compile(r"(\d+)_app_(\d+)\.log")
+_log_offsets: dict = {}  # app_id -> byte offset already scanned
+
+async def pip_install_package(package:str, app_folder:Path) -> Tuple[bool, str]:
     try:
         def run_install(pkg):
-            res = subprocess.run(["python3", "-m", "pip", "install", pkg],
+            res = subprocess.run(["python3", "-m", "pip", "install",
+                                  "--disable-pip-version-check", "--no-input", "--quiet", "--prefer-binary",
+                                  "--target", str(app_folder / APP_DEPS_DIRNAME), pkg],
                                  capture_output=True, text=True, timeout=PIP_INSTALL_TIMEOUT)
             return res.returncode, res.stdout + "\n" + res.stderr
         rc, out = await asyncio.to_thread(run_install, package)
@@ -260,91 +493,127 @@ async def pip_install_package(package:str) -> Tuple[bool, str]:
     except Exception as e:
         return False, f"pip install failed: {e}"
 
+def read_log_delta(app_id:int, log_path:Path) -> bytes:
+    """Return the bytes appended to log_path since the previous call for this app."""
+    size = os.path.getsize(log_path)
+    last = _log_offsets.get(app_id)
+    if last is None or size < last:
+        # first sight (or log was truncated): only look at the recent tail
+        last = max(0, size - LOG_SCAN_FIRST_BYTES)
+    if size == last:
+        _log_offsets[app_id] = last
+        return b""
+    with open(log_path, "rb") as f:
+        f.seek(last)
+        chunk = f.read(size - last)
+    _log_offsets[app_id] = last + len(chunk)
+    return chunk
+
 async def scan_logs_for_missing_modules(bot: Bot):
+    if awatch is not None:
+        try:
+            await watch_logs_for_missing_modules(bot)
+            return
+        except Exception:
+            log.warning("inotify log watcher unavailable; falling back to polling every %ss", LOG_SCAN_INTERVAL, exc_info=True)
+    await poll_logs_for_missing_modules(bot)
+
+async def watch_logs_for_missing_modules(bot: Bot):
+    # Only awatch() itself can raise out of this loop; per-batch work is guarded below,
+    # so an app-level failure never ends the watcher or downgrades it to polling.
+    # Check everything once first: an app that crashed while the bot was down won't write again.
+    await check_running_app_logs(bot)
+    async for changes in awatch(LOGS_DIR):
+        changed = set()
+        for change, path in changes:
+            if change == Change.deleted:
+                continue
+            m = _LOG_NAME_RE.fullmatch(os.path.basename(path))
+            if m:
+                changed.add(int(m.group(2)))
+        if changed:
+            await check_running_app_logs(bot, changed)
+
+async def poll_logs_for_missing_modules(bot: Bot):
     while True:
         await asyncio.sleep(LOG_SCAN_INTERVAL)
-        rows = list_running_apps()
-        for app_id, user_id, name, pid in rows:
-            log_path = LOGS_DIR / f"{user_id}_app_{app_id}.log"
-            if not log_path.exists():
-                continue
+        await check_running_app_logs(bot)
+
+async def check_running_app_logs(bot: Bot, only_ids: Optional[set] = None):
+    try:
+        rows = await alist_running_apps()
+    except Exception:
+        log.exception("log watcher: could not list running apps")
+        return
+    for app_id, user_id, name, pid in rows:
+        if only_ids is not None and app_id not in only_ids:
+            continue
+        try:
+            await check_app_log(bot, app_id, user_id, pid)
+        except Exception:
+            log.exception("log watcher: check failed for app %s", app_id)
+
+async def check_app_log(bot: Bot, app_id:int, user_id:int, pid:int):
+    log_path = LOGS_DIR / f"{user_id}_app_{app_id}.log"
+    try:
+        chunk = await asyncio.to_thread(read_log_delta, app_id, log_path)
+    except Exception:
+        return
+    if b"ModuleNotFoundError" not in chunk:
+        return
+    app = await aget_app(app_id)
+    if not app:
+        return
+    install_attempts = app[10] or 0
+    if install_attempts >= MODULE_INSTALL_RETRIES:
+        return
+    matches = _MISSING_MODULE_RE.findall(chunk)
+    if not matches:
+        return
+    pkg = matches[-1].decode().split(".")[0]
+    chat_id = app[2]
+    try:
+        await bot.send_message(chat_id, f"⚠️ App *{app[3]}* (id `{app_id}`) missing package `{pkg}`. Attempting `pip install {pkg}`...", parse_mode="Markdown")
+    except Exception:
+        pass
+    if pid and pid>0:
+        try:
+            stop_process(pid)
+        except Exception:
+            pass
+    await amark_app_installing(app_id, user_id)
+    app_folder = Path(app[4])
+    ok, out = await pip_install_package(pkg, app_folder)
+    if ok:
+        await asyncio.sleep(1)
+        entry = app_folder / app[5]
+        log_p = LOGS_DIR / f"{user_id}_app_{app_id}.log"
+        started, pidstr = start_process(app_id, entry, app_folder, log_p)
+        if started:
+            await aupdate_app_pid(app_id, int(pidstr), "running", user_id)
             try:
-                txt = log_path.read_text(errors="ignore")[-4000:]
+                await bot.send_message(chat_id, f"✅ Installed `{pkg}` and restarted app *{app[3]}* — pid `{pidstr}`.", parse_mode="Markdown")
             except Exception:
-                continue
-            if ("ModuleNotFoundError" in txt or "No module named" in txt):
-                app = get_app(app_id)
-                if not app:
-                    continue
-                install_attempts = app[10] or 0
-                if install_attempts >= MODULE_INSTALL_RETRIES:
-                    continue
-                pkg = None
-                for line in txt.splitlines()[::-1]:
-                    if "ModuleNotFoundError" in line and "No module named" in line:
-                        if "'" in line:
-                            pkg = line.split("'")[1]
-                            break
-                    if "No module named" in line:
-                        parts = line.split("No module named")
-                        if len(parts) > 1:
-                            candidate = parts[1].strip().strip(" '\"")
-                            pkg = candidate.split(".")[0]
-                            break
-                if not pkg:
-                    continue
-                chat_id = app[2]
-                try:
-                    await bot.send_message(chat_id, f"⚠️ App *{app[3]}* (id `{app_id}`) missing package `{pkg}`. Attempting `pip install {pkg}`...", parse_mode="Markdown")
-                except Exception:
-                    pass
-                if pid and pid>0:
-                    try:
-                        stop_process(pid)
-                        set_app_status(app_id, "installing")
-                    except Exception:
-                        pass
-                increment_install_attempts(app_id)
-                ok, out = await pip_install_package(pkg)
-                if ok:
-                    set_app_status(app_id, "restarting")
-                    await asyncio.sleep(1)
-                    app_folder = Path(app[4])
-                    entry = app_folder / app[5]
-                    log_p = LOGS_DIR / f"{user_id}_app_{app_id}.log"
-                    started, pidstr = start_process(entry, app_folder, log_p)
-                    if started:
-                        update_app_pid(app_id, int(pidstr), "running")
-                        try:
-                            await bot.send_message(chat_id, f"✅ Installed `{pkg}` and restarted app *{app[3]}* — pid `{pidstr}`.", parse_mode="Markdown")
-                        except Exception:
-                            pass
-                    else:
-                        set_app_status(app_id, "error")
-                        try:
-                            await bot.send_message(chat_id, f"❌ Installed `{pkg}` but failed to start app: {pidstr}", parse_mode="Markdown")
-                        except Exception:
-                            pass
-                else:
-                    set_app_status(app_id, "error")
-                    try:
-                        await bot.send_message(chat_id, f"❌ Failed to install `{pkg}` for app *{app[3]}*. Output:\n<pre>{out[:1000]}</pre>", parse_mode="HTML")
-                    except Exception:
-                        pass
+                pass
+        else:
+            await aset_app_status(app_id, "error", user_id)
+            try:
+                await bot.send_message(chat_id, f"❌ Installed `{pkg}` but failed to start app: {pidstr}", parse_mode="Markdown")
+            except Exception:
+                pass
+    else:
+        await aset_app_status(app_id, "error", user_id)
+        try:
+            await bot.send_message(chat_id, f"❌ Failed to install `{pkg}` for app *{app[3]}*. Output:\n<pre>{out[:1000]}</pre>", parse_mode="HTML")
+        except Exception:
+            pass
 
 # ---------------- Bot UI helpers ----------------
-def app_kb(app_id:int):
-    kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton("🟢 Start", callback_data=f"start:{app_id}"),
-         InlineKeyboardButton("🔴 Stop", callback_data=f"stop:{app_id}")],
-        [InlineKeyboardButton("📜 Logs", callback_data=f"logs:{app_id}"),
-         InlineKeyboardButton("🧾 Info", callback_data=f"info:{app_id}")],
-        [InlineKeyboardButton("❌ Delete", callback_data=f"delete:{app_id}")]
-    ])
-    return kb
-
-def user_panel_kb(user_id:int):
-    apps = list_user_apps(user_id)
+TG_MAX_MESSAGE_CHARS = 4000  # Telegram allows 4096; keep headroom for entity parsing
+TG_MAX_KEYBOARD_BUTTONS = 100
+MYAPPS_BUTTONS_PER_APP = 5  # buttons per row in myapps_kb
+async def user_panel_kb(user_id:int):
+    apps = await alist_user_apps_cached(user_id)
     buttons = []
     for r in apps[:8]:
         aid, name, entry, pid, status, created = r
@@ -354,8 +623,52 @@ def user_panel_kb(user_id:int):
     buttons.append([InlineKeyboardButton("Refresh", callback_data="panel_refresh")])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+def myapps_kb(rows):
+    buttons = []
+    for aid, name, entry, pid, status, created in rows:
+        buttons.append([
+            InlineKeyboardButton(text=name, callback_data=f"info:{aid}"),
+            InlineKeyboardButton(text="🟢", callback_data=f"start:{aid}"),
+            InlineKeyboardButton(text="🔴", callback_data=f"stop:{aid}"),
+            InlineKeyboardButton(text="📜", callback_data=f"logs:{aid}"),
+            InlineKeyboardButton(text="❌", callback_data=f"delete:{aid}"),
+        ])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+def myapps_messages(rows):
+    """Split /myapps into (text, keyboard) pairs that each fit Telegram's text and button limits."""
+    apps_per_msg = TG_MAX_KEYBOARD_BUTTONS // MYAPPS_BUTTONS_PER_APP
+    messages, batch, lines, size = [], [], [], 0
+    for row in rows:
+        rid, name, entrypoint, pid, status, created_at = row
+        if len(entrypoint) > 200:
+            entrypoint = "…" + entrypoint[-200:]
+        line = f"• *{name}* (id `{rid}`)\n  entry: `{entrypoint}`\n  status: `{status}` pid: `{pid}`\n  created: `{created_at}`"
+        if batch and (len(batch) >= apps_per_msg or size + len(line) + 2 > TG_MAX_MESSAGE_CHARS):
+            messages.append(("\n\n".join(lines), myapps_kb(batch)))
+            batch, lines, size = [], [], 0
+        batch.append(row)
+        lines.append(line)
+        size += len(line) + 2
+    if batch:
+        messages.append(("\n\n".join(lines), myapps_kb(batch)))
+    return messages
+
 # ---------------- Bot & Dispatcher ----------------
+class SendRateLimit(BaseRequestMiddleware):
+    """Token-bucket throttle for outgoing messages so bursts stay under Telegram's limit."""
+
+    def __init__(self, rate:int = SEND_RATE_PER_SEC):
+        self.limiter = AsyncLimiter(rate, 1)
+
+    async def __call__(self, make_request, bot, method):
+        if isinstance(method, (SendMessage, EditMessageText)):
+            async with self.limiter:
+                return await make_request(bot, method)
+        return await make_request(bot, method)
+
 bot = Bot(BOT_TOKEN, parse_mode="Markdown")
+bot.session.middleware(SendRateLimit())
 dp = Dispatcher()
 
 async def human_typing(chat_id:int, seconds:float=0.6):
@@ -365,10 +678,23 @@ async def human_typing(chat_id:int, seconds:float=0.6):
     except Exception:
         pass
 
+async def download_document(doc: types.Document, dest: Path):
+    """Stream a Telegram document straight into dest, writing each network chunk to the fd as it arrives."""
+    file = await bot.get_file(doc.file_id)
+    url = bot.session.api.file_url(bot.token, file.file_path)
+    fd = os.open(dest, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        async for chunk in bot.session.stream_content(url=url, timeout=DOWNLOAD_TIMEOUT, chunk_size=DOWNLOAD_CHUNK_SIZE):
+            view = memoryview(chunk)
+            while view:
+                view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
 # ---------------- Handlers ----------------
 @dp.message(Command(commands=["start"]))
 async def cmd_start(msg: types.Message):
-    register_user(msg.from_user.id)
+    await aregister_user(msg.from_user.id)
     await human_typing(msg.chat.id, 0.6)
     intro = (
         "👋 *Welcome to Python Host Pro*\n\n"
@@ -400,21 +726,10 @@ async def cmd_help(msg: types.Message):
 async def cmd_stats(msg: types.Message):
     mem = psutil.virtual_memory()
     uptime = time.time() - psutil.boot_time()
-    total_users = 0
-    total_apps = 0
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    try:
-        cur.execute("SELECT COUNT(*) FROM users")
-        total_users = cur.fetchone()[0] or 0
-    except Exception:
-        total_users = 0
     try:
-        cur.execute("SELECT COUNT(*) FROM apps")
-        total_apps = cur.fetchone()[0] or 0
+        total_users, total_apps = await acount_users_and_apps()
     except Exception:
-        total_apps = 0
-    conn.close()
+        total_users, total_apps = 0, 0
     txt = (
         f"📊 *Host Stats*\n"
         f"Uptime: `{human_seconds(uptime)}`\n"
@@ -427,18 +742,17 @@ async def cmd_stats(msg: types.Message):
 @dp.message(Command(commands=["myapps"]))
 async def cmd_myapps(msg: types.Message):
     uid = msg.from_user.id
-    rows = list_user_apps(uid)
+    rows = await alist_user_apps(uid)
     if not rows:
         await msg.answer("You don't have any apps yet. Send a `.py` file or `.zip` as Document to upload.")
         return
-    for rid, name, entrypoint, pid, status, created_at in rows:
-        txt = f"• *{name}* (id `{rid}`)\n  entry: `{entrypoint}`\n  status: `{status}` pid: `{pid}`\n  created: `{created_at}`"
-        await msg.answer(txt, reply_markup=app_kb(rid))
+    for text, kb in myapps_messages(rows):
+        await msg.answer(text, reply_markup=kb)
 
 @dp.message(Command(commands=["panel"]))
 async def cmd_panel(msg: types.Message):
     uid = msg.from_user.id
-    kb = user_panel_kb(uid)
+    kb = await user_panel_kb(uid)
     await msg.answer("🧭 Your Panel — quick app access", reply_markup=kb)
 
 @dp.message()
@@ -447,8 +761,8 @@ async def handle_upload(msg: types.Message):
     if not doc:
         return
     uid = msg.from_user.id
-    register_user(uid)
-    existing = list_user_apps(uid)
+    await aregister_user(uid)
+    existing = await alist_user_apps(uid)
     if len(existing) >= MAX_APPS_PER_USER:
         await msg.answer(f"❌ App limit reached ({MAX_APPS_PER_USER}). Delete an app first.")
         return
@@ -459,38 +773,47 @@ async def handle_upload(msg: types.Message):
     user_folder = USERS_DIR / str(uid) / f"app_{timestamp}_{safe}"
     user_folder.mkdir(parents=True, exist_ok=True)
     saved_path = user_folder / fname
-    await msg.document.download(destination_file=saved_path)
+    try:
+        await download_document(doc, saved_path)
+    except Exception as e:
+        log.warning("download of %r for user %s failed", fname, uid, exc_info=True)
+        await asyncio.to_thread(shutil.rmtree, user_folder, ignore_errors=True)
+        await msg.answer(f"❌ Download failed: {e}")
+        return
     await msg.answer(f"📥 Uploaded `{fname}` — processing...")
     entrypoint = None
     if ext == ".zip":
         try:
-            with zipfile.ZipFile(saved_path, "r") as z:
-                z.extractall(user_folder)
-            py = find_first_py(user_folder)
-            if not py:
-                await msg.answer("❌ No .py found inside the zip.")
-                return
-            entrypoint = py.relative_to(user_folder).as_posix()
+            entrypoint = await asyncio.to_thread(extract_zip, saved_path, user_folder)
         except zipfile.BadZipFile:
+            await asyncio.to_thread(shutil.rmtree, user_folder, ignore_errors=True)
             await msg.answer("❌ Bad zip file.")
             return
+        except ZipTooLarge:
+            await asyncio.to_thread(shutil.rmtree, user_folder, ignore_errors=True)
+            await msg.answer("❌ Zip contents too large.")
+            return
+        if not entrypoint:
+            await asyncio.to_thread(shutil.rmtree, user_folder, ignore_errors=True)
+            await msg.answer("❌ No .py found inside the zip.")
+            return
     elif ext == ".py":
         entrypoint = fname
     else:
         await msg.answer("ℹ️ Only `.py` and `.zip` uploads are supported for automatic execution. File saved.")
         return
     app_name = safe_name(Path(fname).stem)
-    app_id = add_app(uid, msg.chat.id, app_name, str(user_folder.resolve()), entrypoint)
+    app_id = await aadd_app(uid, msg.chat.id, app_name, str(user_folder.resolve()), entrypoint)
     log_file = LOGS_DIR / f"{uid}_app_{app_id}.log"
     log_file.touch(exist_ok=True)
     await msg.answer(f"🆕 App registered as id `{app_id}`. Starting now...")
     entry = user_folder / entrypoint
-    ok, pid_or_msg = start_process(entry, user_folder, log_file)
+    ok, pid_or_msg = start_process(app_id, entry, user_folder, log_file)
     if ok:
-        update_app_pid(app_id, int(pid_or_msg), "running")
+        await aupdate_app_pid(app_id, int(pid_or_msg), "running", uid)
         await msg.answer(f"🚀 App *{app_name}* started (id `{app_id}`) — pid `{pid_or_msg}`", parse_mode="Markdown")
     else:
-        set_app_status(app_id, "error")
+        await aset_app_status(app_id, "error", uid)
         await msg.answer(f"❌ Failed to start app: {pid_or_msg}")
 
 @dp.message(Command(commands=["logs"]))
@@ -500,7 +823,7 @@ async def cmd_logs(msg: types.Message):
         await msg.answer("Usage: /logs <app_id>")
         return
     aid = int(args)
-    row = get_app(aid)
+    row = await aget_app(aid)
     if not row:
         await msg.answer("App not found.")
         return
@@ -513,12 +836,11 @@ async def cmd_logs(msg: types.Message):
         await msg.answer("No logs yet.")
         return
     try:
-        txt = log_path.read_text(errors="ignore")
+        txt, truncated = await asyncio.to_thread(tail_bytes, log_path, APP_LOG_TAIL_CHARS)
     except Exception as e:
         await msg.answer(f"Error reading log: {e}")
         return
-    if len(txt) > APP_LOG_TAIL_CHARS:
-        txt = txt[-APP_LOG_TAIL_CHARS:]
+    if truncated:
         txt = "⤵️ *Last ~{n} chars of log:*\n\n".format(n=APP_LOG_TAIL_CHARS) + "```\n" + txt + "\n```"
         await msg.answer(txt)
     else:
@@ -531,7 +853,7 @@ async def cmd_stop(msg: types.Message):
         await msg.answer("Usage: /stop <app_id>")
         return
     aid = int(args)
-    app = get_app(aid)
+    app = await aget_app(aid)
     if not app:
         await msg.answer("App not found.")
         return
@@ -542,11 +864,10 @@ async def cmd_stop(msg: types.Message):
     pid = app[6]
     if pid and pid>0:
         stop_process(pid)
-        set_app_status(aid, "stopped")
-        update_app_pid(aid, 0, "stopped")
+        await aset_app_stopped(aid, app[1])
         await msg.answer(f"🛑 Stopped app `{aid}`.")
     else:
-        set_app_status(aid, "stopped")
+        await aset_app_stopped(aid, app[1])
         await msg.answer("App is not running.")
 
 # Callback handlers (inline buttons)
@@ -554,7 +875,7 @@ async def cmd_stop(msg: types.Message):
 async def cb_start(q: types.CallbackQuery):
     _, aid = q.data.split(":",1)
     aid = int(aid)
-    app = get_app(aid)
+    app = await aget_app(aid)
     if not app:
         await q.answer("App not found.")
         return
@@ -564,12 +885,12 @@ async def cb_start(q: types.CallbackQuery):
         return
     entry = Path(app[4]) / app[5]
     log_path = LOGS_DIR / f"{app[1]}_app_{aid}.log"
-    ok, pid_or_msg = start_process(entry, Path(app[4]), log_path)
+    ok, pid_or_msg = start_process(aid, entry, Path(app[4]), log_path)
     if ok:
-        update_app_pid(aid, int(pid_or_msg), "running")
+        await aupdate_app_pid(aid, int(pid_or_msg), "running", app[1])
         await q.message.answer(f"🚀 Started app `{app[3]}` (id `{aid}`) — pid `{pid_or_msg}`")
     else:
-        set_app_status(aid, "error")
+        await aset_app_status(aid, "error", app[1])
         await q.message.answer(f"❌ Start failed: {pid_or_msg}")
     await q.answer()
 
@@ -577,7 +898,7 @@ async def cb_start(q: types.CallbackQuery):
 async def cb_stop_cb(q: types.CallbackQuery):
     _, aid = q.data.split(":",1)
     aid = int(aid)
-    app = get_app(aid)
+    app = await aget_app(aid)
     if not app:
         await q.answer("App not found.")
         return
@@ -588,11 +909,10 @@ async def cb_stop_cb(q: types.CallbackQuery):
     pid = app[6]
     if pid and pid>0:
         stop_process(pid)
-        set_app_status(aid, "stopped")
-        update_app_pid(aid, 0, "stopped")
+        await aset_app_stopped(aid, app[1])
         await q.message.answer(f"🛑 Stopped app `{app[3]}` (id `{aid}`).")
     else:
-        set_app_status(aid, "stopped")
+        await aset_app_stopped(aid, app[1])
         await q.message.answer("App is not running.")
     await q.answer()
 
@@ -600,7 +920,7 @@ async def cb_stop_cb(q: types.CallbackQuery):
 async def cb_logs_cb(q: types.CallbackQuery):
     _, aid = q.data.split(":",1)
     aid = int(aid)
-    app = get_app(aid)
+    app = await aget_app(aid)
     if not app:
         await q.answer("App not found.")
         return
@@ -613,7 +933,7 @@ async def cb_logs_cb(q: types.CallbackQuery):
         await q.message.answer("No logs yet.")
         await q.answer()
         return
-    txt = log_path.read_text(errors="ignore")[-APP_LOG_TAIL_CHARS:]
+    txt, _ = await asyncio.to_thread(tail_bytes, log_path, APP_LOG_TAIL_CHARS)
     await q.message.answer("```\n" + txt + "\n```")
     await q.answer()
 
@@ -621,7 +941,7 @@ async def cb_logs_cb(q: types.CallbackQuery):
 async def cb_info(q: types.CallbackQuery):
     _, aid = q.data.split(":",1)
     aid = int(aid)
-    app = get_app(aid)
+    app = await aget_app(aid)
     if not app:
         await q.answer("App not found.")
         return
@@ -635,7 +955,8 @@ async def cb_info(q: types.CallbackQuery):
         try:
             p = psutil.Process(pid)
             uptime = human_seconds(time.time() - p.create_time())
-            cpu = p.cpu_percent(interval=0.1)
+            cpu = process_cpu_percent(p)
+            cpu = "n/a" if cpu is None else cpu
             mem_kb = p.memory_info().rss // 1024
             txt = f"*{app[3]}* (id `{aid}`)\nstatus: `{status}`\npid: `{pid}`\nuptime: `{uptime}`\ncpu%: `{cpu}` mem(kB): `{mem_kb}`"
         except Exception:
@@ -649,7 +970,7 @@ async def cb_info(q: types.CallbackQuery):
 async def cb_delete(q: types.CallbackQuery):
     _, aid = q.data.split(":",1)
     aid = int(aid)
-    app = get_app(aid)
+    app = await aget_app(aid)
     if not app:
         await q.answer("App not found.")
         return
@@ -660,7 +981,7 @@ async def cb_delete(q: types.CallbackQuery):
     pid = app[6]
     if pid and pid>0:
         stop_process(pid)
-    deleted = delete_app(aid)
+    deleted = await adelete_app(aid)
     if deleted:
         await q.message.answer(f"🗑️ App `{aid}` deleted.")
     else:
@@ -670,7 +991,7 @@ async def cb_delete(q: types.CallbackQuery):
 @dp.callback_query(lambda c: c.data == "panel_refresh")
 async def cb_panel_refresh(q: types.CallbackQuery):
     uid = q.from_user.id
-    kb = user_panel_kb(uid)
+    kb = await user_panel_kb(uid)
     try:
         await q.message.edit_text("🧭 Your Panel — refreshed", reply_markup=kb)
     except Exception:
@@ -684,15 +1005,9 @@ async def cmd_admin(msg: types.Message):
     if uid not in ADMIN_IDS:
         await msg.answer("Unauthorized.")
         return
-    rows = list_running_apps()
+    rows = await alist_running_apps()
     total_running = len(rows)
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("SELECT COUNT(*) FROM users")
-    total_users = cur.fetchone()[0] or 0
-    cur.execute("SELECT COUNT(*) FROM apps")
-    total_apps = cur.fetchone()[0] or 0
-    conn.close()
+    total_users, total_apps = await acount_users_and_apps()
     text = (f"🛡️ *Admin Panel*\nUsers: `{total_users}`\nApps: `{total_apps}`\nRunning: `{total_running}`\n\n"
             "Use inline buttons to control apps.")
     kb = InlineKeyboardMarkup(inline_keyboard=[
@@ -707,15 +1022,12 @@ async def admin_stop_all(q: types.CallbackQuery):
     if uid not in ADMIN_IDS:
         await q.answer("Not allowed.")
         return
-    rows = list_running_apps()
-    stopped = 0
-    for aid, user_id, name, pid in rows:
-        if pid and pid>0:
-            stop_process(pid)
-            set_app_status(aid, "stopped")
-            update_app_pid(aid, 0, "stopped")
-            stopped += 1
-    await q.message.answer(f"🛑 Stopped {stopped} apps.")
+    rows = await alist_running_apps()
+    targets = [(aid, user_id, pid) for aid, user_id, name, pid in rows if pid and pid>0]
+    await asyncio.gather(*(asyncio.to_thread(stop_process, pid) for aid, user_id, pid in targets))
+    if targets:
+        await aset_apps_stopped([(aid, user_id) for aid, user_id, pid in targets])
+    await q.message.answer(f"🛑 Stopped {len(targets)} apps.")
     await q.answer()
 
 @dp.callback_query(lambda c: c.data == "admin_list_running")
@@ -724,7 +1036,7 @@ async def admin_list_running(q: types.CallbackQuery):
     if uid not in ADMIN_IDS:
         await q.answer("Not allowed.")
         return
-    rows = list_running_apps()
+    rows = await alist_running_apps()
     text = "🏃 Running apps:\n"
     for aid, user_id, name, pid in rows:
         text += f"• id {aid} | user {user_id} | {name} | pid {pid}\n"
@@ -735,13 +1047,12 @@ async def admin_list_running(q: types.CallbackQuery):
 
 # Startup
 async def on_startup():
-    init_db()
+    await asyncio.to_thread(init_db)
     asyncio.create_task(scan_logs_for_missing_modules(bot))
 
 if __name__ == "__main__":
     print("Starting HostBot v3...")
     try:
-        import logging
         logging.basicConfig(level=logging.INFO)
         dp.startup.register(on_startup)
         dp.run_polling(bot)